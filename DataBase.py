@@ -6,21 +6,73 @@ from typing import List, Dict, Any, Optional
 from datetime import datetime
 import os
 from queries import *
+from migrations import aplicar_migracoes, verificar_planos
+from planejador import PlanejadorCiclo
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 import sys
+import threading
+import time
 
 with open('config.json') as f:
     config = json.load(f)
 
+PROFILING_PADRAO = {
+    "cprofile": False,
+    "diretorio_perfis": "perfis",
+    "slow_query": False,
+    "slow_query_ms": 500,
+    "slow_query_log": "slow_query_log.txt",
+    "tempos_filiais": False
+}
+
+def carregar_profiling(log=print) -> Dict[str, Any]:
+    """Relê a seção profiling do config.json (vale a partir do próximo cíclo, sem reiniciar)"""
+    profiling = dict(PROFILING_PADRAO)
+    try:
+        with open('config.json') as f:
+            lido = json.load(f).get("profiling", {})
+    except Exception as e:
+        log(f"ERRO ao ler profiling do config.json, usando padrão (desligado): {e}")
+        return profiling
+
+    # Converte para o tipo do padrão; valor inválido fica no padrão, sem derrubar as consultas
+    for chave, valor in lido.items():
+        padrao = PROFILING_PADRAO.get(chave)
+        try:
+            if isinstance(padrao, bool):
+                if isinstance(valor, str):
+                    valor = valor.strip().lower() in ("1", "true", "sim", "on")
+                profiling[chave] = bool(valor)
+            elif isinstance(padrao, (int, float)):
+                profiling[chave] = float(valor)
+            elif isinstance(padrao, str):
+                profiling[chave] = str(valor)
+        except (TypeError, ValueError):
+            log(f"ERRO profiling.{chave} inválido ({valor!r}), usando {padrao!r}")
+    return profiling
+
 class DatabaseManager:
     def __init__(self):
         self.tns_admin = r"C:\oracle\product\11.2.0\client_1\network\admin"
-        self.oracle_conn = None
+        self.oracle_pool = None
+        self._oracle_pool_lock = threading.Lock()
         self.pg_conn = None
         self.mysql_conn = None
         self.log_file = "monitoramento_log.txt"
+        self.tempos_filiais = defaultdict(float)
+        self._slow_query_lock = threading.Lock()
+        planejamento = config.get("planejamento", {})
+        self.planejador = PlanejadorCiclo(
+            orcamentos={
+                "descoberta": planejamento.get("orcamento_descoberta_seg"),
+                "d0": planejamento.get("orcamento_d0_seg")
+            },
+            arquivo_estado=planejamento.get("arquivo_estado", "planejamento_estado.json")
+        )
         self._init_log()
+        self.profiling = carregar_profiling(self._log)
 
     def _init_log(self):
         """Inicializa o arquivo de log"""
@@ -38,14 +90,75 @@ class DatabaseManager:
         if print_to_console:
             print(log_entry.strip())
 
+    def _log_error_d0(self, message: str):
+        """Registra erro do D0 no log"""
+        self._log(f"ERRO D0: {message}")
+
+    def _executar(self, cursor, nome: str, query: str, params=None, filial: Optional[int] = None):
+        """
+        Executa a query e retorna as linhas; registra no slow-query log se passar do limite.
+        Queries que falham (timeout, erro de banco) são sempre registradas, com o erro.
+        """
+        inicio = time.perf_counter()
+        rows = None
+        erro = None
+        try:
+            cursor.execute(query, params)
+            rows = cursor.fetchall() if cursor.description else None
+            return rows
+        except Exception as e:
+            erro = e
+            raise
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            if self.profiling["slow_query"]:
+                try:
+                    self._registrar_slow_query(cursor, nome, params, filial, duracao_ms, rows, erro)
+                except Exception as e:
+                    # Falha no log não pode trocar o resultado nem esconder o erro da consulta
+                    self._log(f"ERRO ao gravar slow-query log: {e}", print_to_console=False)
+
+    def _registrar_slow_query(self, cursor, nome, params, filial, duracao_ms, rows, erro):
+        if erro is None and duracao_ms < self.profiling["slow_query_ms"]:
+            return
+        linhas = "-" if erro is not None else len(rows) if rows is not None else cursor.rowcount
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        entrada = (f"[{timestamp}] {nome} | filial={filial} | params={params} | "
+                   f"{duracao_ms:.0f} ms | linhas={linhas}")
+        if erro is not None:
+            entrada += f" | ERRO: {erro}"
+        with self._slow_query_lock:
+            with open(self.profiling["slow_query_log"], 'a', encoding="utf-8") as log:
+                log.write(entrada + "\n")
+
+    def _log_tempos_filiais(self, etapa: str):
+        """Emite a tabela de tempo por filial da passada e zera os contadores"""
+        if self.profiling["tempos_filiais"] and self.tempos_filiais:
+            linhas = [f"TEMPO POR FILIAL - {etapa}", f"{'Filial':>8} | {'Segundos':>10}"]
+            for filial, segundos in sorted(self.tempos_filiais.items(), key=lambda t: t[1], reverse=True):
+                linhas.append(f"{filial:>8} | {segundos:>10.2f}")
+            self._log("\n".join(linhas))
+        self.tempos_filiais.clear()
+
+    def _pendentes_por_filial(self) -> Dict[int, int]:
+        """Pendências D0 por filial, lidas do resumo"""
+        try:
+            if not self.mysql_conn:
+                if not self.connect_to_mysql():
+                    return {}
+            with self.mysql_conn.cursor() as cursor:
+                rows = self._executar(cursor, "pendentes_por_filial", pendentes_por_filial())
+                return {int(row[0]): int(row[1] or 0) for row in rows}
+        except Exception as e:
+            self._log(f"Erro ao buscar pendências por filial: {e}")
+            return {}
+
     def get_filiais_from_oracle(self) -> List[int]:
         """Obtém lista de filiais do Oracle"""
         try:
-            self.connect_to_oracle() 
-            
-            with self.oracle_conn.cursor() as cursor:
-                cursor.execute(consulta_filias())
-                return [int(row[0]) for row in cursor.fetchall()]
+            with self._oracle_cursor() as cursor:
+                rows = self._executar(cursor, "consulta_filias", consulta_filias())
+                return [int(row[0]) for row in rows]
                 
         except Exception as e:
             self._log(f"ERRO Oracle - Busca de filiais: {e}")
@@ -69,27 +182,39 @@ class DatabaseManager:
             return False
 
     def connect_to_oracle(self):
-        os.environ["TNS_ADMIN"] = self.tns_admin
-        if self.oracle_conn is None:
-            self.oracle_conn = oracle.connect(
+        """Cria o pool de sessões Oracle (threaded), compartilhado entre as threads de validação"""
+        with self._oracle_pool_lock:
+            if self.oracle_pool is not None:
+                return self.oracle_pool
+
+            os.environ["TNS_ADMIN"] = self.tns_admin
+            self.oracle_pool = oracle.SessionPool(
                 user=config["oracle"]["user"],
                 password=config["oracle"]["password"],
-                dsn=config["oracle"]["database"]
+                dsn=config["oracle"]["database"],
+                min=config["oracle"].get("pool_min", 1),
+                max=config["oracle"].get("pool_max", 8),
+                increment=1,
+                threaded=True,
+                getmode=oracle.SPOOL_ATTRVAL_WAIT
             )
-            self._log("Conectado ao Oracle.")
-        else:
-            # Opcional: testar se a conexão ainda está válida
-            try:
-                with self.oracle_conn.cursor() as cursor:
-                    cursor.execute("SELECT 1 FROM DUAL")
-            except:
-                self._log("Reconectando Oracle porque a conexão anterior caiu.")
-                self.oracle_conn.close()
-                self.oracle_conn = oracle.connect(
-                    user=config["oracle"]["user"],
-                    password=config["oracle"]["password"],
-                    dsn=config["oracle"]["database"]
-                )
+            # O pool já descarta sessões mortas na aquisição, sem o SELECT 1 FROM DUAL por consulta
+            self.oracle_pool.stmtcachesize = config["oracle"].get("stmt_cache", 50)
+            self._log("Pool Oracle criado.")
+            return self.oracle_pool
+
+    @contextmanager
+    def _oracle_cursor(self):
+        """Cursor de uma sessão do pool; a sessão volta para o pool ao sair do bloco"""
+        pool = self.connect_to_oracle()
+        conn = pool.acquire()
+        try:
+            with conn.cursor() as cursor:
+                cursor.arraysize = config["oracle"].get("prefetch", 100)
+                cursor.prefetchrows = config["oracle"].get("prefetch", 100)
+                yield cursor
+        finally:
+            pool.release(conn)
 
     def connect_to_mysql(self) -> bool:
         """Conecta ao MySQL para logar os erros"""
@@ -106,6 +231,34 @@ class DatabaseManager:
             self._log(f"ERRO MySQL - Conexão: {e}")
             return False
 
+    def _rollback_mysql(self):
+        """Desfaz a transação sem mascarar o erro original se a conexão já caiu"""
+        try:
+            self.mysql_conn.rollback()
+        except Exception as e:
+            self._log(f"ERRO MySQL - Rollback: {e}")
+
+    def preparar_mysql(self) -> bool:
+        """Aplica as migrações do D0 e confere os planos das consultas. Retorna se as migrações foram aplicadas"""
+        try:
+            if not self.mysql_conn:
+                if not self.connect_to_mysql():
+                    return False
+            criados = aplicar_migracoes(self.mysql_conn, self._log)
+            if criados:
+                self._log(f"Migração: {criados} objeto(s) criado(s) no MySQL")
+        except Exception as e:
+            self._log(f"ERRO ao preparar MySQL: {e}")
+            return False
+
+        try:
+            regredidas = verificar_planos(self.mysql_conn, self._log)
+            if not regredidas:
+                self._log("Planos das consultas D0 usando índice.")
+        except Exception as e:
+            self._log(f"ERRO ao verificar planos das consultas D0: {e}")
+        return True
+
     def parse_payload(self, payload: str) -> Dict[str, Any]:
         """Extrai dados do payload JSON"""
         try:
@@ -159,16 +312,21 @@ class DatabaseManager:
 
         payload_data = self.parse_payload(evento['payload'])
         id_chave = payload_data.get('id_cupom_pg') or payload_data.get('pedido')
+        # Mesma classificação de tipo_erro_D0()
+        if payload_data.get('pedido') is not None:
+            tipo_erro = "venda"
+        elif evento.get('id_cupom') is not None:
+            tipo_erro = "divida"
+        else:
+            tipo_erro = "credito_Pessoal"
         try:
             with self.mysql_conn.cursor() as cursor:
                 sql_check , params = validar_item_duplicadoD0(filial, nr_cupom)
-                cursor.execute(sql_check, params)
-                resultado = cursor.fetchone()
-                if resultado and resultado[0] > 0:
+                resultado = self._executar(cursor, "validar_item_duplicadoD0", sql_check, params, filial)
+                if resultado and resultado[0][0] > 0:
                     self._log(f"Erro já registrado para filial {filial}, pedido {id_chave}, pulando inserção.")
                     return False
-                sql = inserir_DO()
-                cursor.execute(sql, (
+                self._executar(cursor, "inserir_DO", inserir_DO(), (
                     filial,
                     payload_data.get('pedido'),
                     payload_data.get('nr_pdv'),
@@ -179,10 +337,16 @@ class DatabaseManager:
                     evento.get('dh_inclusao'),
                     evento.get('id_evento'),
                     'NOK'
-                ))
+                ), filial)
+                self._executar(cursor, "resumo_inserir_D0", resumo_inserir_D0(), (
+                    filial,
+                    evento.get('dh_inclusao'),
+                    tipo_erro
+                ), filial)
             self.mysql_conn.commit()
             return True
         except Exception as e:
+            self._rollback_mysql()
             self._log(f"ERRO MySQL - Insert filial {filial}: {e}")
             return False
 
@@ -193,18 +357,25 @@ class DatabaseManager:
                 raise Exception("Não foi possível conectar ao MySQL")
 
             filiais = self.get_filiais_from_oracle()
+            filiais = self.planejador.ordenar_filiais(filiais, self._pendentes_por_filial())
             self._log(f"Total de filiais a processar: {len(filiais)}")
+            self.planejador.iniciar_etapa("descoberta")
 
             total_erros = 0
 
-            for filial in filiais:
+            for posicao, filial in enumerate(filiais):
+                if self.planejador.tempo_esgotado():
+                    self._log(f"Orçamento do cíclo esgotado: {len(filiais) - posicao} filiais ficam para o próximo cíclo")
+                    break
+
+                inicio_filial = time.perf_counter()
+                teve_erro = False
                 try:
                     if not self.connect_to_pg(filial):
                         continue
 
                     with self.pg_conn.cursor() as pg_cursor:
-                        pg_cursor.execute(querie_business())
-                        eventos = pg_cursor.fetchall()
+                        eventos = self._executar(pg_cursor, "querie_business", querie_business(), filial=filial)
 
                         if not eventos:
                             self._log(f"Filial {filial}: Nenhum evento com erro")
@@ -235,8 +406,7 @@ class DatabaseManager:
                             # Verifica se já houve evento de sucesso no banco para essa chave
                             chave_payload = "id_pedido_pg" if tipo == "pedido" else "id_cupom_pg"
                             query_valid, params = validar_busines_event(chave_payload, chave)
-                            pg_cursor.execute(query_valid, params)
-                            resultados = pg_cursor.fetchall()
+                            resultados = self._executar(pg_cursor, "validar_busines_event", query_valid, params, filial)
 
                             if any(row[1].strip().lower() == "sucesso" for row in resultados):
                                 self._log(f"Filial {filial}: Ignorado {tipo} {chave}, pois já teve evento com sucesso.")
@@ -249,6 +419,7 @@ class DatabaseManager:
                             )
 
                         if erros_para_inserir:
+                            teve_erro = True
                             for filial, nr_cupom, evento in erros_para_inserir:
                                 self.insert_erro_mysql(filial, nr_cupom, evento)
                             total_erros += len(erros_para_inserir)
@@ -258,13 +429,19 @@ class DatabaseManager:
                 finally:
                     if self.pg_conn:
                         self.pg_conn.close()
+                    duracao = time.perf_counter() - inicio_filial
+                    self.tempos_filiais[filial] += duracao
+                    self.planejador.registrar_filial(filial, duracao, teve_erro)
 
             self._log(f"Processamento concluído. Total de erros logados: {total_erros}")
+            self._log_tempos_filiais("PROCESSAMENTO DE FILIAIS")
+            self.planejador.salvar_estado()
 
         except Exception as e:
             self._log(f"ERRO no processamento principal: {e}")
             raise
         finally:
+            self.planejador.encerrar_etapa()
             self.close_all()
 
 
@@ -287,7 +464,7 @@ class DatabaseManager:
                 return f"[Filial {filial}] Erro ao conectar ao PostgreSQL"
 
             with conn.cursor() as cursor:
-                cursor.execute(limpeza_linha_erro_completa())
+                self._executar(cursor, "limpeza_linha_erro_completa", limpeza_linha_erro_completa(), filial=filial)
                 removidos = cursor.rowcount
                 conn.commit()
                 return f"[Filial {filial}] Removidos {removidos} eventos redundantes com erro"
@@ -304,14 +481,14 @@ class DatabaseManager:
     def close_all(self):
         """Fecha todas as conexões abertas"""
         try:
-            if self.oracle_conn:
+            if self.oracle_pool:
                 try:
-                    self.oracle_conn.close()
-                    self._log("Conexão Oracle fechada com sucesso.")
+                    self.oracle_pool.close()
+                    self._log("Pool Oracle fechado com sucesso.")
                 except Exception as e:
-                    self._log(f"Erro ao fechar conexão Oracle: {e}")
+                    self._log(f"Erro ao fechar pool Oracle: {e}")
                 finally:
-                    self.oracle_conn = None
+                    self.oracle_pool = None
 
             if self.pg_conn:
                 try:
@@ -344,8 +521,7 @@ class DatabaseManager:
                     return []
                 
             self.cursor = self.mysql_conn.cursor()
-            self.cursor.execute(valida_D0())
-            rows = self.cursor.fetchall()
+            rows = self._executar(self.cursor, "valida_D0", valida_D0())
 
             pedidos = []
             for row in rows:
@@ -356,6 +532,7 @@ class DatabaseManager:
                     "id_cupom": row[3],
                     "id_evento": row[6],
                     "is_sap": row[7],
+                    "data_inclusao": row[8],
                 })
             return pedidos
 
@@ -363,115 +540,238 @@ class DatabaseManager:
             self._log(f"Erro ao buscar pedidos pendentes: {e}")
             return []
 
+    def mostrar_resumo_D0(self, dias: int = 10) -> List[Dict[str, Any]]:
+        """Pendências e tempo de resolução por filial/tipo, lidos do resumo"""
+        try:
+            if not self.mysql_conn:
+                if not self.connect_to_mysql():
+                    self._log("Falha ao conectar no MySQL.")
+                    return []
+
+            with self.mysql_conn.cursor() as cursor:
+                rows = self._executar(cursor, "consulta_resumo_D0", consulta_resumo_D0(), (dias,))
+                col_names = [desc[0] for desc in cursor.description]
+                return [dict(zip(col_names, row)) for row in rows]
+
+        except Exception as e:
+            self._log(f"Erro ao buscar resumo D0: {e}")
+            return []
+
+    def mostrar_resumo_D0_por_dia(self, dias: int = 10) -> List[Dict[str, Any]]:
+        """Pendências e tempo de resolução por dia/filial, lidos do resumo"""
+        try:
+            if not self.mysql_conn:
+                if not self.connect_to_mysql():
+                    self._log("Falha ao conectar no MySQL.")
+                    return []
+
+            with self.mysql_conn.cursor() as cursor:
+                rows = self._executar(cursor, "consulta_resumo_D0_dia", consulta_resumo_D0_dia(), (dias,))
+                col_names = [desc[0] for desc in cursor.description]
+                return [dict(zip(col_names, row)) for row in rows]
+
+        except Exception as e:
+            self._log(f"Erro ao buscar resumo D0 por dia: {e}")
+            return []
+
     def validar_D0(self):
         """ VALIDAR D0 para atualizar os eventos de venda e dívida """
         pedidos = self.mostrar_pedidos_pendentes()
+        pedidos = self.planejador.ordenar_pendentes(pedidos, self._pendentes_por_filial())
+        self.planejador.iniciar_etapa("d0")
+        try:
+            self._validar_pendentes_D0(pedidos)
+        finally:
+            self.planejador.encerrar_etapa()
+            self.planejador.salvar_estado()
 
-        for p in pedidos:
-            pedido = p["pedido"]
-            filial = p["filial"]
-            nr_cupom = p["nr_cupom"]
-            id_cupom = p["id_cupom"]
-            id_evento = p["id_evento"]
-            is_sap = p["is_sap"]
-
-            self._log(f"Processando Pedido {pedido} / Filial {filial}...")
-
-            # Decide o tipo
-            campo_pg = valor_pg = tipo = None
-
-            if pedido is None and id_cupom is not None:
-                campo_pg = "id_cupom_pg"
-                valor_pg = id_cupom
-                tipo = "divida"
-            elif pedido is not None:
-                campo_pg = "id_pedido_pg"
-                valor_pg = pedido
-                tipo = "venda"
-            elif pedido is None and id_cupom is None:
-                valor_pg = nr_cupom
-                tipo = "credito_Pessoal"
-
-            # 1️ Validação PG obrigatória
-            if campo_pg and valor_pg:
-                self.connect_to_pg(filial)
-                pg_cursor = self.pg_conn.cursor()
-                query, params = validar_busines_event(campo_pg, valor_pg)
-                pg_cursor.execute(query, params)
-                resultado_pg = pg_cursor.fetchall()
-                pg_cursor.close()
-
-                evento_sucesso = any(r[1].lower() == "sucesso" for r in resultado_pg)
-
-                for r in resultado_pg:
-                    self._log(f"Evento {tipo} PG: ID {r[0]} | Status: {r[1]}")
-
-                if not evento_sucesso:
-                    self._log(f"Evento {tipo} ainda não está com status SUCESSO no PG. Pulando pedido {pedido}.")
-                    continue
-
-            # 2️ Se PG estiver OK, validar tipo do pedido no Oracle (somente se for VENDA)
-            tipo_pedido = None
-            if tipo == "venda" and pedido:
-                try:
-                    tipo_info = self.validar_tipo_retira_posterior(pedido, filial)
-                    if not tipo_info:
-                        self._log(f"Tipo do Pedido {pedido} não encontrado. Ignorando...")
+        self._log_tempos_filiais("VALIDAÇÃO D0")
+        return True
+
+    def _validar_pendentes_D0(self, pedidos: List[Dict[str, Any]]):
+        """
+        Executa as etapas do D0 sobre as pendências já ordenadas, em lotes. O orçamento é
+        conferido antes de começar cada item; o que passou no PG termina Oracle e fechamento
+        no mesmo lote, então as mais prioritárias fecham de ponta a ponta
+        """
+        tamanho_lote = config.get("planejamento", {}).get("lote_d0", 20)
+        for inicio_lote in range(0, len(pedidos), tamanho_lote):
+            if self.planejador.tempo_esgotado():
+                self._log(f"Orçamento do cíclo esgotado: {len(pedidos) - inicio_lote} pendências D0 ficam para o próximo cíclo")
+                break
+            self._validar_lote_D0(pedidos[inicio_lote:inicio_lote + tamanho_lote])
+
+    def _validar_lote_D0(self, lote: List[Dict[str, Any]]):
+        # 1️ Validação PG (serial, uma conexão por filial); dívida e crédito já fecham aqui
+        vendas = []
+        for posicao, p in enumerate(lote):
+            if self.planejador.tempo_esgotado():
+                self._log(f"Orçamento do cíclo esgotado: {len(lote) - posicao} pendências D0 do lote ficam para o próximo cíclo")
+                break
+
+            inicio_item = time.perf_counter()
+            try:
+                tipo = self._validar_pg_D0(p)
+                if tipo and tipo != "venda":
+                    self._fechar_D0(p, tipo)
+                if tipo != "venda":
+                    # Fechada ou recusada no PG; venda só conta depois do Oracle
+                    self.planejador.registrar_tentativa_D0(p)
+            finally:
+                self.tempos_filiais[p["filial"]] += time.perf_counter() - inicio_item
+            if tipo == "venda":
+                vendas.append(p)
+
+        # 2️ e 3️ Tipo do pedido (um array bind por filial) e WMB no Oracle, filiais em paralelo pelo pool
+        vendas_por_filial = defaultdict(list)
+        for p in vendas:
+            vendas_por_filial[p["filial"]].append(p)
+
+        oracle_ok = set()
+        filiais_concluidas = set()
+        if vendas_por_filial:
+            max_workers = min(config["oracle"].get("pool_max", 8), len(vendas_por_filial))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(self._validar_oracle_filial_D0, filial, itens): filial
+                    for filial, itens in vendas_por_filial.items()
+                }
+                for future in as_completed(futures):
+                    filial = futures[future]
+                    try:
+                        aprovados, duracao = future.result()
+                    except Exception as e:
+                        self._log_error_d0(f"Erro no Oracle para filial {filial}: {e}")
                         continue
+                    self.tempos_filiais[filial] += duracao
+                    oracle_ok.update(aprovados)
+                    filiais_concluidas.add(filial)
+
+        # 4️ Atualiza as vendas no MySQL (serial) na ordem de prioridade
+        for p in vendas:
+            if id(p) in oracle_ok:
+                self._fechar_D0(p, "venda")
+            if p["filial"] in filiais_concluidas:
+                # Fechada ou recusada no Oracle/WMB
+                self.planejador.registrar_tentativa_D0(p)
+
+    def _validar_pg_D0(self, p: Dict[str, Any]) -> Optional[str]:
+        """Valida o pedido pendente no PG; retorna o tipo se puder seguir ou None para pular"""
+        pedido = p["pedido"]
+        filial = p["filial"]
+        nr_cupom = p["nr_cupom"]
+        id_cupom = p["id_cupom"]
+
+        self._log(f"Processando Pedido {pedido} / Filial {filial}...")
+
+        # Decide o tipo
+        campo_pg = valor_pg = tipo = None
+
+        if pedido is None and id_cupom is not None:
+            campo_pg = "id_cupom_pg"
+            valor_pg = id_cupom
+            tipo = "divida"
+        elif pedido is not None:
+            campo_pg = "id_pedido_pg"
+            valor_pg = pedido
+            tipo = "venda"
+        elif pedido is None and id_cupom is None:
+            valor_pg = nr_cupom
+            tipo = "credito_Pessoal"
+
+        if campo_pg and valor_pg:
+            self.connect_to_pg(filial)
+            pg_cursor = self.pg_conn.cursor()
+            query, params = validar_busines_event(campo_pg, valor_pg)
+            resultado_pg = self._executar(pg_cursor, "validar_busines_event", query, params, filial)
+            pg_cursor.close()
+
+            evento_sucesso = any(r[1].lower() == "sucesso" for r in resultado_pg)
+
+            for r in resultado_pg:
+                self._log(f"Evento {tipo} PG: ID {r[0]} | Status: {r[1]}")
+
+            if not evento_sucesso:
+                self._log(f"Evento {tipo} ainda não está com status SUCESSO no PG. Pulando pedido {pedido}.")
+                return None
+
+        return tipo
+
+    def _validar_oracle_filial_D0(self, filial: int, itens: List[Dict[str, Any]]):
+        """
+        Valida as vendas de uma filial no Oracle; roda nas threads do validar_D0.
+        Retorna (ids das vendas aprovadas, duração)
+        """
+        inicio = time.perf_counter()
+        aprovados = set()
+        try:
+            tipos = self.tipos_pedido_em_lote(filial, [p["pedido"] for p in itens])
+        except Exception as e:
+            self._log_error_d0(f"Erro ao validar tipo do pedido no Oracle: {e}")
+            return aprovados, time.perf_counter() - inicio
 
-                    tipo_pedido = tipo_info[2]  # "P" ou "R"
-                    self._log(f"Tipo do Pedido: {tipo_pedido}")
+        for p in itens:
+            if self._validar_wmb_D0(p, tipos.get(int(p["pedido"]))):
+                aprovados.add(id(p))
 
-                except Exception as e:
-                    self._log_error_d0(f"Erro ao validar tipo do pedido no Oracle: {e}")
-                    continue
+        return aprovados, time.perf_counter() - inicio
 
-            # 3️ Validar na WMB de acordo com o tipo
-            if tipo == "venda":
-                try:
-                    resultado_wmb = None
+    def _validar_wmb_D0(self, p: Dict[str, Any], tipo_pedido: Optional[str]) -> bool:
+        """Valida a subida na WMB de acordo com o tipo do pedido (P/R)"""
+        pedido = p["pedido"]
+        filial = p["filial"]
+        nr_cupom = p["nr_cupom"]
 
-                    if tipo_pedido == "P":
-                        resultado_wmb = self.validar_wmb_posterior(pedido)
-                    elif tipo_pedido == "R":
-                        resultado_wmb = self.validar_cupom_wmb_event(filial, nr_cupom)
+        if not tipo_pedido:
+            self._log(f"Tipo do Pedido {pedido} não encontrado. Ignorando...")
+            return False
+        self._log(f"Tipo do Pedido: {tipo_pedido}")
 
-                    if resultado_wmb:
-                        self._log(f"Subiu para WMB com sucesso: {resultado_wmb}")
-                    else:
-                        self._log(f"WMB não retornou resultado para pedido {pedido}")
-                        continue
+        try:
+            resultado_wmb = None
 
-                except Exception as e:
-                    self._log_error_d0(f"Erro ao validar WMB: {e}")
-                    continue
+            if tipo_pedido == "P":
+                resultado_wmb = self.validar_wmb_posterior(pedido)
+            elif tipo_pedido == "R":
+                resultado_wmb = self.validar_cupom_wmb_event(filial, nr_cupom)
 
-            # 4️ Atualiza no MySQL se tudo OK
-            try:
-                if tipo == "divida":
-                    self.cursor.execute(update_divida_D0(), (filial, id_cupom))
-                elif tipo == "venda":
-                    self.cursor.execute(update_venda_D0(), (filial, pedido))
-                self.mysql_conn.commit()
-                self._log(f"Pedido {pedido} atualizado no MySQL com sucesso.")
-            except Exception as e:
-                self._log(f"Erro ao atualizar no MySQL: {e}")
+            if resultado_wmb:
+                self._log(f"Subiu para WMB com sucesso: {resultado_wmb}")
+                return True
 
-        return True
+            self._log(f"WMB não retornou resultado para pedido {pedido}")
+            return False
 
-    def validar_wmb_posterior(self, pedido: int) -> List[int]:
+        except Exception as e:
+            self._log_error_d0(f"Erro ao validar WMB: {e}")
+            return False
+
+    def _fechar_D0(self, p: Dict[str, Any], tipo: str):
+        """Marca o pedido como OK no MySQL e atualiza o resumo"""
+        pedido = p["pedido"]
+        filial = p["filial"]
+        id_cupom = p["id_cupom"]
         try:
-        
-            self.connect_to_oracle()
-           
+            if tipo == "divida":
+                self._executar(self.cursor, "resumo_fechar_divida_D0", resumo_fechar_divida_D0(), (filial, id_cupom), filial)
+                self._executar(self.cursor, "update_divida_D0", update_divida_D0(), (filial, id_cupom), filial)
+            elif tipo == "venda":
+                self._executar(self.cursor, "resumo_fechar_venda_D0", resumo_fechar_venda_D0(), (filial, pedido), filial)
+                self._executar(self.cursor, "update_venda_D0", update_venda_D0(), (filial, pedido), filial)
+            self.mysql_conn.commit()
+            self._log(f"Pedido {pedido} atualizado no MySQL com sucesso.")
+        except Exception as e:
+            self._rollback_mysql()
+            self._log(f"Erro ao atualizar no MySQL: {e}")
 
+    def validar_wmb_posterior(self, pedido: int) -> List[int]:
+        try:
             query, params = validar_wmb_event(pedido)
-            
 
-            with self.oracle_conn.cursor() as cursor:
-                cursor.execute(query, params)
+            with self._oracle_cursor() as cursor:
+                rows = self._executar(cursor, "validar_wmb_event", query, params)
 
-                for row in cursor.fetchall():
+                for row in rows:
                     self._log(f"WMB_ROW: {row[0]},Filial: {row[1]} Pedido: {row[2]}, Subiu: {row[3]}")
                     return [row[0], row[1], row[2], row[3]]
 
@@ -484,15 +784,12 @@ class DatabaseManager:
     def validar_tipo_retira_posterior(self, pedido, filial):
     
         try:
-            self.connect_to_oracle()
-            
             query, params = tipo_pedido(pedido, filial)
-            
 
-            with self.oracle_conn.cursor() as cursor:
-                cursor.execute(query, params)
+            with self._oracle_cursor() as cursor:
+                rows = self._executar(cursor, "tipo_pedido", query, params, filial)
 
-                for row in cursor.fetchall():
+                for row in rows:
                     self._log(f"Filial: {row[0]}, Pedido: {row[1]}, Tipo Pedido: {row[2]}")
                     return [row[0], row[1], row[2]]
 
@@ -502,16 +799,27 @@ class DatabaseManager:
             self._log(f"ERRO de rodar WMB: {e}")
             raise
     
+    def tipos_pedido_em_lote(self, filial: int, pedidos: List[int]) -> Dict[int, str]:
+        """Tipo ("P" ou "R") de cada pedido da filial numa consulta, com os pedidos num array bind"""
+        tipos = {}
+        with self._oracle_cursor() as cursor:
+            lista = cursor.connection.gettype("SYS.ODCINUMBERLIST").newobject()
+            lista.extend([int(pedido) for pedido in pedidos])
+            query, params = tipo_pedido_lote(lista, filial)
+            rows = self._executar(cursor, "tipo_pedido_lote", query, params, filial)
+            for row in rows:
+                self._log(f"Filial: {row[0]}, Pedido: {row[1]}, Tipo Pedido: {row[2]}")
+                tipos.setdefault(int(row[1]), row[2])
+        return tipos
+
     def validar_cupom_wmb_event(self, filail, cupom):
         try:
-            self.connect_to_oracle()
-            
             query, params = validar_cupom_wmb_event(filail, cupom)
-            
-            with self.oracle_conn.cursor() as cursor:
-                cursor.execute(query, params)
 
-                for row in cursor.fetchall():
+            with self._oracle_cursor() as cursor:
+                rows = self._executar(cursor, "validar_cupom_wmb_event", query, params, filail)
+
+                for row in rows:
                     self._log(f"Filial: {row[0]}, Cupom: {row[1]}, Subiu: {row[2]}, Pedido Filho: {row[3]}, Data: {row[4]}")
                     return [row[0], row[1], row[2], row[3], row[4]]
 
@@ -1,10 +1,11 @@
 from DataBase import DatabaseManager
+import cProfile
+import os
 import time
 from datetime import datetime
 
 def validar_pedidos_d0(monitor):
     monitor._log("INICIANDO VALIDAÇÃO D0...")
-    monitor.validar_D0()
     if monitor.validar_D0() is None:
         monitor._log("Nenhum pedido D0 encontrado para validação.")
         monitor._log("\n###############VALIDAÇÃO D0 CONCLUÍDA.################\n")
@@ -15,10 +16,32 @@ def processar_pedidos_d0(monitor):
     monitor.process_filiais()
     monitor._log("\n########################\nPROCESSAMENTO DE FILIAIS CONCLUÍDO.\n######################### \n")
 
+def salvar_perfil(monitor, profiler):
+    """
+    Grava o perfil do cíclo. O cProfile só mede a thread principal: as consultas
+    Oracle feitas nas threads do validar_D0 não entram no arquivo
+    """
+    try:
+        diretorio = monitor.profiling["diretorio_perfis"]
+        os.makedirs(diretorio, exist_ok=True)
+        arquivo = os.path.join(diretorio, f"ciclo_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof")
+        profiler.dump_stats(arquivo)
+        monitor._log(f"Perfil do cíclo salvo em {arquivo}")
+    except Exception as e:
+        monitor._log(f"ERRO ao salvar perfil do cíclo: {e}")
+
 def main():
+    mysql_preparado = False
     while True:
         monitor = DatabaseManager()
+        if not mysql_preparado:
+            # Na instância do cíclo, depois do _init_log, para os avisos ficarem no arquivo.
+            # Se falhar (MySQL fora, por exemplo), tenta de novo no próximo cíclo
+            mysql_preparado = monitor.preparar_mysql()
+        profiler = cProfile.Profile() if monitor.profiling["cprofile"] else None
         try:
+            if profiler:
+                profiler.enable()
             monitor._log("===== INICÍO DO CÍCLO DE MONITORAMENTO =====")
             monitor.start_time = time.time()
             validar_pedidos_d0(monitor)
@@ -28,6 +51,9 @@ def main():
         except Exception as e:
             monitor._log_error_d0(f"ERRO na execução do cíclo: {e}")
         finally:
+            if profiler:
+                profiler.disable()
+                salvar_perfil(monitor, profiler)
             monitor._log("Fechando conexões e aguardando próximo cíclo...")
             monitor.close_all()
             monitor._log("Aguardando 10 minutos para o próximo cíclo...\n")
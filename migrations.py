@@ -0,0 +1,127 @@
+from typing import List
+from queries import *
+
+# Índices da monitoraVendaEventoErro: (nome, colunas)
+INDICES_D0 = [
+    # valida_D0: is_sap = 'NOK' dentro da janela de data_inclusao
+    ("idx_mvee_is_sap_data", "is_sap, data_inclusao"),
+    # validar_item_duplicadoD0: filial + nr_cupom + is_sap
+    ("idx_mvee_filial_cupom_sap", "filial, nr_cupom, is_sap"),
+    # update_venda_D0
+    ("idx_mvee_filial_pedido", "filial, pedido"),
+    # update_divida_D0
+    ("idx_mvee_filial_id_cupom", "filial, id_cupom_pg"),
+]
+
+def indice_existe():
+    return """
+        SELECT count(*)
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE()
+        AND table_name = 'monitoraVendaEventoErro'
+        AND index_name = %s
+    """
+
+def criar_indice(nome, colunas):
+    return f"CREATE INDEX {nome} ON monitoraVendaEventoErro ({colunas})"
+
+def tabela_existe():
+    return """
+        SELECT count(*)
+        FROM information_schema.tables
+        WHERE table_schema = DATABASE()
+        AND table_name = %s
+    """
+
+RESUMO_D0 = "monitoraVendaEventoErroResumo"
+# Criada e populada com este nome, renomeada para RESUMO_D0 só depois da carga
+RESUMO_D0_CARGA = "monitoraVendaEventoErroResumo_carga"
+
+def criar_resumo_D0(tabela):
+    return f"""
+        CREATE TABLE {tabela} (
+            filial INT NOT NULL,
+            dia DATE NOT NULL,
+            tipo VARCHAR(20) NOT NULL,
+            total_erros INT NOT NULL DEFAULT 0,
+            pendentes INT NOT NULL DEFAULT 0,
+            resolvidos INT NOT NULL DEFAULT 0,
+            soma_resolucao_seg BIGINT NOT NULL DEFAULT 0,
+            max_resolucao_seg BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (filial, dia, tipo),
+            KEY idx_resumo_dia (dia)
+        )
+    """
+
+def popular_resumo_D0(tabela):
+    """
+    Carga inicial a partir do histórico. Tempo de resolução só é conhecido
+    para fechamentos feitos depois da criação, então resolvidos começa em zero
+    """
+    return f"""
+        insert into {tabela}(filial, dia, tipo, total_erros, pendentes)
+        SELECT
+            filial,
+            DATE(data_inclusao),
+            {tipo_erro_D0()},
+            count(*),
+            SUM(is_sap = 'NOK')
+        FROM monitoraVendaEventoErro
+        GROUP BY 1, 2, 3
+    """
+
+def planos_D0():
+    """
+    Consultas D0 verificadas com EXPLAIN na subida: (nome, query, params de exemplo)
+    """
+    query_dup, params_dup = validar_item_duplicadoD0(0, 0)
+    return [
+        ("valida_D0", valida_D0(), None),
+        ("validar_item_duplicadoD0", query_dup, params_dup),
+        ("update_venda_D0", update_venda_D0(), (0, 0)),
+        ("update_divida_D0", update_divida_D0(), (0, 0)),
+    ]
+
+
+def aplicar_migracoes(conn, log) -> int:
+    """Cria os índices e tabelas que ainda não existem. Retorna quantos foram criados"""
+    criados = 0
+    with conn.cursor() as cursor:
+        for nome, colunas in INDICES_D0:
+            cursor.execute(indice_existe(), (nome,))
+            if cursor.fetchone()[0] > 0:
+                continue
+            log(f"Migração: criando índice {nome} ({colunas})")
+            cursor.execute(criar_indice(nome, colunas))
+            criados += 1
+
+        # CREATE TABLE faz commit implícito: a carga vai numa tabela auxiliar e o RENAME
+        # (atômico) só publica o resumo completo. Sobra de uma carga interrompida é descartada
+        cursor.execute(tabela_existe(), (RESUMO_D0,))
+        if cursor.fetchone()[0] == 0:
+            log(f"Migração: criando {RESUMO_D0}")
+            cursor.execute(f"DROP TABLE IF EXISTS {RESUMO_D0_CARGA}")
+            cursor.execute(criar_resumo_D0(RESUMO_D0_CARGA))
+            cursor.execute(popular_resumo_D0(RESUMO_D0_CARGA))
+            conn.commit()
+            cursor.execute(f"RENAME TABLE {RESUMO_D0_CARGA} TO {RESUMO_D0}")
+            criados += 1
+    conn.commit()
+    return criados
+
+def verificar_planos(conn, log) -> List[str]:
+    """Roda EXPLAIN nas consultas D0 e avisa quando o plano cai em full scan"""
+    regredidas = []
+    with conn.cursor() as cursor:
+        for nome, query, params in planos_D0():
+            cursor.execute("EXPLAIN " + query.strip().rstrip(";"), params)
+            col_names = [desc[0] for desc in cursor.description]
+            for row in cursor.fetchall():
+                plano = dict(zip(col_names, row))
+                if plano.get("table") not in ("monitoraVendaEventoErro", "mvee"):
+                    continue
+                if plano.get("type") == "ALL":
+                    log(f"AVISO: plano de {nome} caiu em full scan "
+                        f"(key={plano.get('key')}, rows={plano.get('rows')})")
+                    regredidas.append(nome)
+    return regredidas
@@ -0,0 +1,117 @@
+import json
+import math
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+class PlanejadorCiclo:
+    """
+    Ordena filiais e pendências D0 por valor e controla o orçamento de tempo de cada etapa do cíclo.
+    O que não couber no orçamento fica para o próximo cíclo (estado salvo em arquivo).
+    """
+    def __init__(self, orcamentos: Dict[str, Optional[float]], arquivo_estado: str, peso_latencia_ewma: float = 0.3):
+        self.orcamentos = orcamentos
+        self.arquivo_estado = arquivo_estado
+        self.peso_latencia_ewma = peso_latencia_ewma
+        self.gasto: Dict[str, float] = {}
+        self.etapa: Optional[str] = None
+        self.inicio_etapa: Optional[float] = None
+        self.estado = self._carregar_estado()
+
+    def _carregar_estado(self) -> Dict[str, Dict[str, Any]]:
+        estado = {}
+        try:
+            with open(self.arquivo_estado, encoding="utf-8") as f:
+                estado = json.load(f)
+        except Exception:
+            pass
+        estado.setdefault("filiais", {})
+        estado.setdefault("pendentes_D0", {})
+        return estado
+
+    def salvar_estado(self):
+        with open(self.arquivo_estado, 'w', encoding="utf-8") as f:
+            json.dump(self.estado, f)
+
+    def iniciar_etapa(self, etapa: str):
+        """Liga o relógio da etapa; o gasto acumula entre chamadas da mesma etapa no cíclo"""
+        self.etapa = etapa
+        self.inicio_etapa = time.time()
+
+    def encerrar_etapa(self):
+        if self.etapa is not None:
+            self.gasto[self.etapa] = self.gasto.get(self.etapa, 0.0) + time.time() - self.inicio_etapa
+        self.etapa = None
+        self.inicio_etapa = None
+
+    def tempo_esgotado(self) -> bool:
+        if self.etapa is None:
+            return False
+        orcamento = self.orcamentos.get(self.etapa)
+        if orcamento is None:
+            return False
+        return self.gasto.get(self.etapa, 0.0) + time.time() - self.inicio_etapa >= orcamento
+
+    def registrar_filial(self, filial: int, duracao: float, teve_erro: bool):
+        """Atualiza latência histórica (média móvel), última visita e último erro da filial"""
+        agora = time.time()
+        info = self.estado["filiais"].setdefault(str(filial), {})
+        latencia = info.get("latencia_seg")
+        peso = self.peso_latencia_ewma
+        info["latencia_seg"] = duracao if latencia is None else peso * duracao + (1 - peso) * latencia
+        info["ultima_visita"] = agora
+        if teve_erro:
+            info["ultimo_erro"] = agora
+
+    def _score_filial(self, filial: int, pendentes: int, agora: float) -> float:
+        info = self.estado["filiais"].get(str(filial), {})
+        if "ultima_visita" not in info:
+            # Nunca visitada: vai na frente
+            return math.inf
+
+        horas_sem_visita = (agora - info["ultima_visita"]) / 3600
+        recencia = 0.0
+        if "ultimo_erro" in info:
+            recencia = 1 / (1 + (agora - info["ultimo_erro"]) / 3600)
+        latencia = max(info.get("latencia_seg", 1.0), 0.5)
+
+        return (1 + math.log1p(pendentes)) * (1 + 2 * recencia) * (1 + horas_sem_visita) / latencia
+
+    def ordenar_filiais(self, filiais: List[int], pendentes: Dict[int, int]) -> List[int]:
+        """Filiais com erro recente, mais pendências e varredura rápida primeiro"""
+        agora = time.time()
+        return sorted(filiais, key=lambda f: -self._score_filial(f, pendentes.get(f, 0), agora))
+
+    @staticmethod
+    def _chave_D0(p: Dict[str, Any]) -> str:
+        return f"{p['filial']}:{p['pedido']}:{p['id_cupom']}:{p['nr_cupom']}"
+
+    def registrar_tentativa_D0(self, p: Dict[str, Any]):
+        self.estado["pendentes_D0"].setdefault(self._chave_D0(p), {})["ultima_tentativa"] = time.time()
+
+    def ordenar_pendentes(self, pedidos: List[Dict[str, Any]], pendentes: Dict[int, int]) -> List[Dict[str, Any]]:
+        """
+        Pendências D0 mais recentes e de filiais com mais pendências primeiro. Cada hora sem
+        tentativa soma tanto quanto um erro novo, então as puladas sobem até serem atendidas
+        """
+        agora = datetime.now()
+        agora_ts = time.time()
+
+        # Mantém no estado só o que ainda está pendente; as novas começam a envelhecer agora
+        anterior = self.estado["pendentes_D0"]
+        atual = {}
+        for p in pedidos:
+            chave = self._chave_D0(p)
+            atual[chave] = anterior.get(chave) or {"visto": agora_ts}
+        self.estado["pendentes_D0"] = atual
+
+        def score(p: Dict[str, Any]) -> float:
+            data_inclusao: Optional[datetime] = p.get("data_inclusao")
+            horas = (agora - data_inclusao).total_seconds() / 3600 if data_inclusao else 240
+            info = atual[self._chave_D0(p)]
+            desde = info.get("ultima_tentativa", info.get("visto", agora_ts))
+            horas_sem_tentativa = (agora_ts - desde) / 3600
+            recencia = 1 / (1 + max(horas, 0))
+            return (1 + math.log1p(pendentes.get(p["filial"], 0))) * (recencia + horas_sem_tentativa)
+
+        return sorted(pedidos, key=lambda p: -score(p))
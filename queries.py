@@ -72,6 +72,24 @@ def tipo_pedido(pedido, filial):
     
     return query,{"pedido":pedido,"filial":filial}
 
+def tipo_pedido_lote(pedidos, filial):
+    """
+    Mesmo que tipo_pedido, para vários pedidos da filial numa ida ao banco.
+    :pedidos é uma coleção (SYS.ODCINUMBERLIST): o texto da query não muda com a quantidade
+    """
+    query = """
+        select 
+        id_emp as filial,
+        id_pvd_multiplo as Pedido,
+        Cd_modal_ent as Posterior_ou_Retira
+        from pedido_venda_multiplo
+        where
+        st_sit_ped <> 99
+        and id_emp = :filial
+        and id_pvd_multiplo in (select column_value from table(:pedidos))
+    """
+    return query, {"filial": filial, "pedidos": pedidos}
+
 #D0
 def inserir_DO():
     return """
@@ -94,7 +112,7 @@ def valida_D0():
         is_sap,
         data_inclusao 
     FROM monitoraVendaEventoErro
-    WHERE NOT is_sap = 'OK'
+    WHERE is_sap = 'NOK'
     AND data_inclusao >= DATE_SUB(CURDATE(), INTERVAL 10 DAY)
     AND data_inclusao < DATE_ADD(CURDATE(), INTERVAL 1 DAY)
 """
@@ -123,11 +141,94 @@ def validar_item_duplicadoD0(filial, nr_cupom):
         FROM monitoraVendaEventoErro mvee 
         where filial = %s
         and nr_cupom = %s
-        and not is_sap = 'OK'
+        and is_sap = 'NOK'
         ;
     """
     return query, (filial, nr_cupom)
 
+# RESUMO D0 (rollup mantido na escrita)
+def tipo_erro_D0():
+    return """
+        CASE
+            WHEN pedido IS NOT NULL THEN 'venda'
+            WHEN id_cupom_pg IS NOT NULL THEN 'divida'
+            ELSE 'credito_Pessoal'
+        END
+    """
+def resumo_inserir_D0():
+    return """
+        insert into monitoraVendaEventoErroResumo(
+            filial, dia, tipo, total_erros, pendentes
+        )
+        values(%s, DATE(%s), %s, 1, 1)
+        on duplicate key update
+            total_erros = total_erros + 1,
+            pendentes = pendentes + 1
+    """
+def _resumo_fechar_D0(filtro):
+    return f"""
+        insert into monitoraVendaEventoErroResumo(
+            filial, dia, tipo, pendentes, resolvidos, soma_resolucao_seg, max_resolucao_seg
+        )
+        SELECT
+            filial,
+            DATE(data_inclusao),
+            {tipo_erro_D0()},
+            -count(*),
+            count(*),
+            SUM(TIMESTAMPDIFF(SECOND, data_inclusao, NOW())),
+            MAX(TIMESTAMPDIFF(SECOND, data_inclusao, NOW()))
+        FROM monitoraVendaEventoErro
+        WHERE filial = %s
+        and {filtro} = %s
+        and is_sap = 'NOK'
+        GROUP BY 1, 2, 3
+        on duplicate key update
+            pendentes = pendentes + VALUES(pendentes),
+            resolvidos = resolvidos + VALUES(resolvidos),
+            soma_resolucao_seg = soma_resolucao_seg + VALUES(soma_resolucao_seg),
+            max_resolucao_seg = GREATEST(max_resolucao_seg, VALUES(max_resolucao_seg))
+    """
+def resumo_fechar_venda_D0():
+    return _resumo_fechar_D0("pedido")
+def resumo_fechar_divida_D0():
+    return _resumo_fechar_D0("id_cupom_pg")
+def consulta_resumo_D0():
+    return """
+        SELECT
+            filial,
+            tipo,
+            SUM(pendentes) as pendentes,
+            SUM(resolvidos) as resolvidos,
+            SUM(soma_resolucao_seg) / NULLIF(SUM(resolvidos), 0) as media_resolucao_seg,
+            MAX(max_resolucao_seg) as max_resolucao_seg
+        FROM monitoraVendaEventoErroResumo
+        WHERE dia >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+        GROUP BY filial, tipo
+        ORDER BY pendentes desc
+    """
+def consulta_resumo_D0_dia():
+    return """
+        SELECT
+            dia,
+            filial,
+            SUM(pendentes) as pendentes,
+            SUM(resolvidos) as resolvidos,
+            SUM(soma_resolucao_seg) / NULLIF(SUM(resolvidos), 0) as media_resolucao_seg,
+            MAX(max_resolucao_seg) as max_resolucao_seg
+        FROM monitoraVendaEventoErroResumo
+        WHERE dia >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+        GROUP BY dia, filial
+        ORDER BY dia desc, pendentes desc
+    """
+def pendentes_por_filial():
+    return """
+        SELECT filial, SUM(pendentes)
+        FROM monitoraVendaEventoErroResumo
+        WHERE dia >= DATE_SUB(CURDATE(), INTERVAL 10 DAY)
+        GROUP BY filial
+    """
+
 # LIMPEZA Business 
 def limpeza_linha_erro_completa():
     return """